@@ -1,6 +1,15 @@
 import os
-import json
+import orjson
+import asyncio
+import concurrent.futures
+import threading
+from collections import OrderedDict
+import httpx
 import requests
+import requests_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
 import streamlit as st
 from groq import Groq
 from dotenv import load_dotenv
@@ -42,9 +51,11 @@ def initialize_bedrock_llm():
         return ChatBedrock(
             model_id="meta.llama3-8b-instruct-v1:0",
             client=get_bedrock_client(),
+            # Only a one-line question is kept, so cap generation length; a low
+            # temperature also keeps answers stable for the question cache
             model_kwargs={
-                "temperature": 0.7,
-                "max_tokens": 256
+                "temperature": 0.3,
+                "max_tokens": 64
             }
         )
     except Exception as e:
@@ -74,27 +85,163 @@ ADDRESSABLE_ISSUES = {
     ]
 }
 
+# The solutions are static, so format them once rather than on every audit
+_ADDRESSABLE_SET = frozenset(ADDRESSABLE_ISSUES)
+_ADDRESSABLE_SOLUTIONS_FORMATTED = {
+    audit_id: '\n'.join(f"- {line}" for line in lines)
+    for audit_id, lines in ADDRESSABLE_ISSUES.items()
+}
+
+# PageSpeed runs take 10-30s, so repeat audits of the same URL are served from
+# a local cache for this many seconds
+PAGESPEED_CACHE_TTL = 600
+
+# (connect, read) timeouts in seconds; PageSpeed can take up to a minute to respond
+PAGESPEED_TIMEOUT = (5, 60)
+
+# Transient statuses worth retrying before reporting an error to the user
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+@st.cache_resource
+def get_pagespeed_session():
+    """Create and return a session that caches PageSpeed responses on disk"""
+    session = requests_cache.CachedSession(
+        'pagespeed_cache',
+        backend='sqlite',
+        expire_after=PAGESPEED_CACHE_TTL,
+        # The API key is passed as `key`, which requests_cache does not redact by
+        # default; ignoring it keeps the secret out of the sqlite file
+        ignored_parameters=['key']
+    )
+    # Keep connections alive so repeat calls reuse the TLS session
+    session.mount('https://', HTTPAdapter(
+        pool_connections=10,
+        pool_maxsize=20,
+        # read=0: a read timeout already spent the full 60s budget, so retrying
+        # it would leave the user waiting minutes for an error
+        max_retries=Retry(total=3, read=0, backoff_factor=0.3, status_forcelist=RETRY_STATUSES)
+    ))
+    return session
+
+def extract_audits(content):
+    """Decode a Lighthouse report, keeping only each audit's title and metricSavings"""
+    audits = orjson.loads(content).get("lighthouseResult", {}).get("audits", {})
+    # Drop the details tables and screenshots so cached reports stay small
+    return {"lighthouseResult": {"audits": {
+        audit_id: {
+            "title": audit_data.get("title"),
+            "metricSavings": audit_data.get("metricSavings")
+        }
+        for audit_id, audit_data in audits.items()
+    }}}
+
+@st.cache_data(ttl=PAGESPEED_CACHE_TTL, show_spinner=False)
+def _fetch_pagespeed(api_url):
+    # Raises on failure so that errors are never cached
+    response = get_pagespeed_session().get(api_url, timeout=PAGESPEED_TIMEOUT)
+    response.raise_for_status()
+    return extract_audits(response.content)
+
+def build_pagespeed_url(site_url, api_key):
+    return f'https://www.googleapis.com/pagespeedonline/v5/runPagespeed?url={site_url}&key={api_key}'
+
 def fetch_json_from_api(site_url, api_key):
-    api_url = f'https://www.googleapis.com/pagespeedonline/v5/runPagespeed?url={site_url}&key={api_key}'
+    api_url = build_pagespeed_url(site_url, api_key)
     try:
-        response = requests.get(api_url)
-        response.raise_for_status()
-        return response.json()
+        return _fetch_pagespeed(api_url)
     except requests.exceptions.RequestException as err:
         return f"Error fetching data: {err}"
-    except json.JSONDecodeError:
+    except orjson.JSONDecodeError:
         return "Failed to decode JSON. Please check the API response."
 
+def _is_transient_http_error(err):
+    if isinstance(err, httpx.HTTPStatusError):
+        return err.response.status_code in RETRY_STATUSES
+    # As with the sync session, a read timeout is not retried
+    return isinstance(err, httpx.TransportError) and not isinstance(err, httpx.ReadTimeout)
+
+@retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(multiplier=0.5, max=8),
+    retry=retry_if_exception(_is_transient_http_error),
+    reraise=True
+)
+async def _aget_pagespeed(client, api_url):
+    response = await client.get(api_url)
+    response.raise_for_status()
+    return response
+
+async def afetch_json(site_urls, api_key):
+    """Fetch PageSpeed reports for several URLs concurrently over one HTTP/2 connection"""
+    async def fetch(client, site_url):
+        try:
+            response = await _aget_pagespeed(client, build_pagespeed_url(site_url, api_key))
+            return extract_audits(response.content)
+        except httpx.HTTPError as err:
+            return f"Error fetching data: {err}"
+        except orjson.JSONDecodeError:
+            return "Failed to decode JSON. Please check the API response."
+
+    async with httpx.AsyncClient(http2=True, timeout=httpx.Timeout(PAGESPEED_TIMEOUT[1], connect=PAGESPEED_TIMEOUT[0])) as client:
+        return await asyncio.gather(*(fetch(client, site_url) for site_url in site_urls))
+
 # client = Groq(api_key=GROQ_API_KEY)
 
-llm = initialize_bedrock_llm()
+# Streamlit re-executes this script on every interaction, so the LLM is built
+# once per process with st.cache_resource and on first use rather than at import
+@st.cache_resource
+def get_llm():
+    llm = initialize_bedrock_llm()
 
-# Add the provider stop sequence key name map to handle the error
-llm.provider_stop_sequence_key_name_map = {
-    'meta': ''
-}
+    # Add the provider stop sequence key name map to handle the error
+    if llm is not None:
+        llm.provider_stop_sequence_key_name_map = {
+            'meta': ''
+        }
+    return llm
+
+# Cap concurrent LLM requests to stay within the provider's rate limits
+LLM_CONCURRENCY = 20
+
+# Manual audits beyond the top few by savings get a static hint instead of a
+# generated question, since each question costs a full LLM round-trip
+MAX_GENERATED_QUESTIONS = 5
+LOW_IMPACT_HINT = "Review this audit's details in the PageSpeed Insights report."
+
+# boto3 is synchronous, so Bedrock calls run on a shared thread pool to keep
+# the event loop free for other requests
+@st.cache_resource
+def get_executor():
+    return concurrent.futures.ThreadPoolExecutor(max_workers=16)
+
+async def ainvoke(prompt: str) -> str:
+    """Invoke the Bedrock LLM without blocking the event loop"""
+    llm = get_llm()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), lambda: llm.invoke(prompt).content)
+
+# Generated questions keyed by normalised audit title, so audits that recur
+# across reports skip the LLM round-trip. The LRU dict is held by st.cache_resource
+# because Streamlit re-executes this script (and its globals) on every rerun; it
+# is shared by every session's thread, so access goes through the lock.
+QUESTION_CACHE_SIZE = 512
+
+@st.cache_resource
+def get_question_cache():
+    return OrderedDict(), threading.Lock()
+
+_question_cache, _question_cache_lock = get_question_cache()
+
+def _question_cache_key(query: str, num_questions: int):
+    return ((query or "").strip().lower(), num_questions)
+
+async def agenerate_questions(query: str, num_questions: int = 1) -> list[dict]:
+    cache_key = _question_cache_key(query, num_questions)
+    with _question_cache_lock:
+        if cache_key in _question_cache:
+            _question_cache.move_to_end(cache_key)
+            return _question_cache[cache_key]
 
-def generate_questions(query: str, num_questions: int = 1) -> list[dict]:
     prompt = f"""
     You are an AI assistant specializing in optimization and issue resolution for web performance metrics. 
     Given the following issue or optimization metric from a PageSpeed Insights report:  
@@ -110,7 +257,7 @@ def generate_questions(query: str, num_questions: int = 1) -> list[dict]:
 
     try:
         # Simulated LLM call for generating the response
-        response = llm.invoke(prompt).content  # Replace with your actual LLM call
+        response = await ainvoke(prompt)  # Replace with your actual LLM call
         questions = []
 
         # print(response)
@@ -122,64 +269,124 @@ def generate_questions(query: str, num_questions: int = 1) -> list[dict]:
 
         # Limit results to `num_questions`
         que=questions[1]
+        with _question_cache_lock:
+            _question_cache[cache_key] = que
+            _question_cache.move_to_end(cache_key)
+            if len(_question_cache) > QUESTION_CACHE_SIZE:
+                _question_cache.popitem(last=False)
         return que
 
     except Exception as e:
         return [{"error": f"Error generating questions: {e}"}]
 
+async def agenerate_questions_batch(queries: list[str]) -> list:
+    """Generate questions for several queries concurrently, preserving order"""
+    semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+
+    async def bounded(query):
+        async with semaphore:
+            return await agenerate_questions(query)
+
+    return await asyncio.gather(*(bounded(query) for query in queries))
+
+def generate_questions(query: str, num_questions: int = 1) -> list[dict]:
+    return asyncio.run(agenerate_questions(query, num_questions))
+
 
 def parse_lighthouse_json(site_url, api_key):
     data = fetch_json_from_api(site_url, api_key)
+    return render_lighthouse_report(data)
+
+def parse_lighthouse_json_batch(site_urls, api_key):
+    """Audit several sites, fetching all of their PageSpeed reports concurrently"""
+    reports = asyncio.run(afetch_json(site_urls, api_key))
+    batch_admin = 0
+    batch_manual = 0
+    for index, (site_url, data) in enumerate(zip(site_urls, reports)):
+        st.subheader(site_url)
+        # Identical reports would otherwise yield duplicate widget IDs; the index
+        # keeps keys unique when a URL is listed twice
+        site_admin, site_manual = render_lighthouse_report(data, key_prefix=f"{index}-{site_url}")
+        batch_admin += site_admin
+        batch_manual += site_manual
+
+    st.subheader("All Sites")
+    st.text_area("Batch Results", value=format_savings_summary(batch_admin, batch_manual), height=200)
+
+def format_savings_summary(total_time_saved_admin, total_time_saved_manual):
+    return (
+        f"Total Admin Panel Savings: {total_time_saved_admin / 1000:.2f} seconds\n"
+        f"Total Manual Intervention Savings: {total_time_saved_manual / 1000:.2f} seconds\n"
+        f"Total Combined Savings: {(total_time_saved_admin + total_time_saved_manual) / 1000:.2f} seconds"
+    )
+
+def render_lighthouse_report(data, key_prefix=None):
+    """Render one Lighthouse report and return its (admin, manual) savings in ms"""
+    results_key = f"{key_prefix}-results" if key_prefix else None
+    summary_key = f"{key_prefix}-summary" if key_prefix else None
     if not data:
-        return "No data fetched from API."
+        st.error("No data fetched from API.")
+        return 0, 0
+    if isinstance(data, str):
+        # fetch helpers report failures as error strings
+        st.error(data)
+        return 0, 0
 
     audits = data.get("lighthouseResult", {}).get("audits", {})
-    results = []
     total_time_saved_admin = 0
     total_time_saved_manual = 0
 
+    admin_results = []
+    manual_audits = []
+    get_priority = PRIORITY_MAPPING.get
     for audit_id, audit_data in audits.items():
-        metric_savings = audit_data.get("metricSavings", {})
-        if not any(metric_savings.values()):
+        savings_values = (audit_data.get("metricSavings") or {}).values()
+        savings = sum(savings_values)
+        # A nonzero total implies a nonzero saving, so any() only runs when
+        # the values cancel out or are all zero
+        if not savings and not any(savings_values):
             continue
 
-        savings = sum(metric_savings.values())
-        priority = PRIORITY_MAPPING.get(audit_id, "Unknown")
+        title = audit_data.get("title")
+        priority = get_priority(audit_id, "Unknown")
 
-        if audit_id in ADDRESSABLE_ISSUES:
+        if audit_id in _ADDRESSABLE_SET:
             total_time_saved_admin += savings
-            solutions = '\n'.join(f"- {line}" for line in ADDRESSABLE_ISSUES[audit_id])
-            result=(
-                f"{audit_data.get('title')} ({priority} priority)\n"
+            solutions = _ADDRESSABLE_SOLUTIONS_FORMATTED[audit_id]
+            admin_results.append(
+                f"{title} ({priority} priority)\n"
                 f"Potential Savings: {savings:.2f} ms\nSolution:\n{solutions}\n"
             )
-            st.text_area("Audit Results", value=result, height=200)
-
-    for audit_id, audit_data in audits.items():
-        metric_savings = audit_data.get("metricSavings", {})
-        if not any(metric_savings.values()):
-            continue
-
-        savings = sum(metric_savings.values())
-        priority = PRIORITY_MAPPING.get(audit_id, "Unknown")
-
-        if audit_id in ADDRESSABLE_ISSUES:
-            continue
         else:
             total_time_saved_manual += savings
-            unknown_question = generate_questions(audit_data.get("title"))
-            result=(
-                f"{audit_data.get('title')} ({priority} priority)\n"
-                f"Potential Savings: {savings:.2f} ms\nGenerated Question:\n- {unknown_question}\n"
-            )
-            st.text_area("Audit Results", value=result, height=200)
+            manual_audits.append((title, priority, savings))
 
-    combined_savings = (
-        f"Total Admin Panel Savings: {total_time_saved_admin / 1000:.2f} seconds\n"
-        f"Total Manual Intervention Savings: {total_time_saved_manual / 1000:.2f} seconds\n"
-        f"Total Combined Savings: {(total_time_saved_admin + total_time_saved_manual) / 1000:.2f} seconds"
+    # Only the highest-impact audits are worth an LLM round-trip; dispatch those
+    # all at once and describe the rest with a static hint
+    manual_audits.sort(key=lambda audit: audit[2], reverse=True)
+    top_audits = manual_audits[:MAX_GENERATED_QUESTIONS]
+    titles = [title for title, _, _ in top_audits]
+    unknown_questions = asyncio.run(agenerate_questions_batch(titles))
+
+    manual_results = [
+        f"{title} ({priority} priority)\n"
+        f"Potential Savings: {savings:.2f} ms\nGenerated Question:\n- {unknown_question}\n"
+        for (title, priority, savings), unknown_question in zip(top_audits, unknown_questions)
+    ]
+    manual_results.extend(
+        f"{title} ({priority} priority)\n"
+        f"Potential Savings: {savings:.2f} ms\nNext Step:\n- {LOW_IMPACT_HINT}\n"
+        for title, priority, savings in manual_audits[MAX_GENERATED_QUESTIONS:]
     )
-    st.text_area("Audit Results", value=combined_savings, height=200)
+
+    # Render every audit in a single widget rather than one text area apiece
+    results = admin_results + manual_results
+    if results:
+        st.text_area("Audit Results", value="\n\n".join(results), height=600, key=results_key)
+
+    combined_savings = format_savings_summary(total_time_saved_admin, total_time_saved_manual)
+    st.text_area("Audit Results", value=combined_savings, height=200, key=summary_key)
+    return total_time_saved_admin, total_time_saved_manual
 
 # Streamlit App
 st.title("Web Analyser")